@@ -1,157 +1,348 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from operator import attrgetter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
+import numpy as np
 import pandas as pd
 
 try:
     from czsc import signals as czsc_signals
     from czsc.objects import RawBar
     from czsc.analyze import CZSC  # type: ignore
+    from czsc.enum import Freq
 except Exception:  # pragma: no cover
     czsc_signals = None
     RawBar = None
     CZSC = None
+    Freq = None
+
+try:
+    from numba import njit
+except Exception:  # pragma: no cover
+    njit = None
+
+
+# bi direction -> int8 code for the divergence kernel; codes 0/1 point up,
+# 2/3 point down, -1 is skipped. Distinct spellings keep distinct codes so
+# "same direction" still means equal values.
+_DIRECTION_CODES = {"up": 0, "向上": 1, "down": 2, "向下": 3}
+_NO_BEICHI, _BEARISH, _BULLISH = 0, 1, 2
+
+
+def _find_divergence_py(dirs: np.ndarray, highs: np.ndarray, lows: np.ndarray) -> tuple[int, int, int]:
+    # Locate the last directed bi and the previous one with the same direction,
+    # then compare their extremes and lengths. Returns (last, prev, kind).
+    last = -1
+    for i in range(dirs.shape[0] - 1, -1, -1):
+        if dirs[i] >= 0:
+            last = i
+            break
+    if last < 0:
+        return -1, -1, _NO_BEICHI
+    prev = -1
+    for i in range(last - 1, -1, -1):
+        if dirs[i] == dirs[last]:
+            prev = i
+            break
+    if prev < 0:
+        return last, -1, _NO_BEICHI
+    kind = _NO_BEICHI
+    if abs(highs[last] - lows[last]) < abs(highs[prev] - lows[prev]):
+        if dirs[last] <= 1 and highs[last] <= highs[prev]:
+            kind = _BEARISH
+        elif dirs[last] >= 2 and lows[last] >= lows[prev]:
+            kind = _BULLISH
+    return last, prev, kind
+
+
+def _find_divergence_np(dirs: np.ndarray, highs: np.ndarray, lows: np.ndarray) -> tuple[int, int, int]:
+    # Same contract as _find_divergence_py, used when numba is missing: the
+    # two backward scans become flatnonzero calls over boolean masks.
+    directed = np.flatnonzero(dirs >= 0)
+    if directed.size == 0:
+        return -1, -1, _NO_BEICHI
+    last = int(directed[-1])
+    same = np.flatnonzero(dirs[:last] == dirs[last])
+    if same.size == 0:
+        return last, -1, _NO_BEICHI
+    prev = int(same[-1])
+    kind = _NO_BEICHI
+    if abs(highs[last] - lows[last]) < abs(highs[prev] - lows[prev]):
+        if dirs[last] <= 1 and highs[last] <= highs[prev]:
+            kind = _BEARISH
+        elif dirs[last] >= 2 and lows[last] >= lows[prev]:
+            kind = _BULLISH
+    return last, prev, kind
+
+
+_find_divergence = njit(cache=True)(_find_divergence_py) if njit is not None else _find_divergence_np
+
+
+# Bars arrive either as a list of per-bar dicts (AoS) or as a get_bars payload
+# carrying {"columns": {field: [...]}} (SoA).
+Bars = Union[List[Dict[str, Any]], Dict[str, Any]]
 
 
-def bars_to_rawbar_objs(bars: List[Dict[str, Any]]) -> List[RawBar]:
+def iter_bar_rows(bars: Bars) -> Iterator[Tuple[Any, ...]]:
+    # Yields plain (symbol, dt, open, close, high, low, vol, amount) tuples so
+    # per-bar consumers never build an intermediate dict or Series per row.
+    if isinstance(bars, dict) and "columns" in bars:
+        columns = bars["columns"]
+        n = len(columns["dt"])
+        return zip(
+            columns.get("code") or [bars["symbol"]] * n,
+            columns["dt"],
+            columns["open"],
+            columns["close"],
+            columns["high"],
+            columns["low"],
+            columns.get("vol") or [0.0] * n,
+            columns.get("amount") or [0.0] * n,
+        )
+    return (
+        (b.get("code") or b["symbol"], b["dt"], b["open"], b["close"], b["high"], b["low"], b.get("vol", 0.0), b.get("amount", 0.0))
+        for b in bars
+    )
+
+
+# Tool freq -> czsc Freq member name; RawBar requires a Freq.
+_CZSC_FREQ_NAMES = {"5m": "F5", "15m": "F15", "30m": "F30", "60m": "F60", "d": "D", "w": "W", "m": "M"}
+
+
+def map_freq_to_czsc(freq: str) -> Any:
+    try:
+        return Freq[_CZSC_FREQ_NAMES[str(freq).lower()]]
+    except KeyError:
+        raise ValueError(f"Unsupported freq: {freq}") from None
+
+
+def bars_to_rawbar_objs(bars: Bars, freq: str) -> List[RawBar]:
     if RawBar is None:
         raise RuntimeError("czsc is not installed; RawBar unavailable")
+    czsc_freq = map_freq_to_czsc(freq)
+    rows = list(iter_bar_rows(bars))
+    # Parse every dt in one call instead of spinning up the parser per bar.
+    dts = pd.to_datetime([r[1] for r in rows], format="ISO8601", cache=True).to_pydatetime()
     rawbars: List[RawBar] = []
-    for i, b in enumerate(bars):
-        dt = pd.to_datetime(b["dt"]).to_pydatetime()
+    for i, ((symbol, _, open_, close, high, low, vol, amount), dt) in enumerate(zip(rows, dts)):
         rb = RawBar(
-            symbol=b.get("code") or b["symbol"],
+            symbol=symbol,
             dt=dt,
             id=i,
-            open=b["open"],
-            close=b["close"],
-            high=b["high"],
-            low=b["low"],
-            vol=b.get("vol", 0.0),
-            amount=b.get("amount", 0.0),
+            freq=czsc_freq,
+            open=open_,
+            close=close,
+            high=high,
+            low=low,
+            vol=vol,
+            amount=amount,
         )
         rawbars.append(rb)
     return rawbars
 
 
-def serialize_dt(obj: Any) -> Any:
-    if isinstance(obj, (datetime, pd.Timestamp)):
-        return pd.to_datetime(obj).to_pydatetime().isoformat()
-    return obj
+# Output field -> candidate attribute names, first match wins. czsc 0.9.x
+# objects expose sdt/edt rather than start_dt/end_dt.
+_BI_FIELDS = (
+    ("direction", ("direction",)),
+    ("high", ("high",)),
+    ("low", ("low",)),
+    ("power", ("power",)),
+    ("length", ("length",)),
+    ("start_dt", ("start_dt", "sdt")),
+    ("end_dt", ("end_dt", "edt")),
+    ("fx_a", ("fx_a",)),
+    ("fx_b", ("fx_b",)),
+)
+_FX_FIELDS = (("dt", ("dt",)), ("price", ("price",)), ("fx", ("fx",)))
+_ZS_FIELDS = (
+    ("zd", ("zd",)),
+    ("zg", ("zg",)),
+    ("gg", ("gg",)),
+    ("dd", ("dd",)),
+    ("start_dt", ("start_dt", "sdt")),
+    ("end_dt", ("end_dt", "edt")),
+    ("level", ("level",)),
+    ("direction", ("direction",)),
+)
+_ZS_FIELD_NAMES = tuple(name for name, _ in _ZS_FIELDS)
 
+_getters: Dict[Tuple[type, tuple], Callable[[Any], Tuple[Any, ...]]] = {}
 
-def chan_basic_signals(df: pd.DataFrame, freq: str) -> List[Dict[str, Any]]:
-    if czsc_signals is None:
-        raise RuntimeError("czsc is not installed; see requirements.txt")
-    df = df.copy()
-    df["dt"] = pd.to_datetime(df["dt"])  # ensure dtype
-    df = df.sort_values("dt").reset_index(drop=True)
 
-    signals: List[Dict[str, Any]] = []
+def _build_getter(obj: Any, fields: tuple) -> Callable[[Any], Tuple[Any, ...]]:
+    resolved = [next((a for a in names if hasattr(obj, a)), None) for _, names in fields]
+    present = [a for a in resolved if a is not None]
+    if len(present) == len(resolved) > 1:
+        return attrgetter(*present)
+    # Some fields are missing on this type: fetch the rest in one C call
+    # ("__class__" keeps the result a tuple) and pad the gaps with None.
+    fetch = attrgetter(*present, "__class__")
+    slots = [i for i, a in enumerate(resolved) if a is not None]
+    n = len(resolved)
+
+    def getter(o: Any) -> Tuple[Any, ...]:
+        out: List[Any] = [None] * n
+        for i, v in zip(slots, fetch(o)):
+            out[i] = v
+        return tuple(out)
+
+    return getter
+
+
+def _get_attrs(obj: Any, fields: tuple) -> Tuple[Any, ...]:
+    # The attribute layout is resolved once per (type, fields) and cached, so
+    # each object costs a single attrgetter call.
+    key = (type(obj), fields)
+    getter = _getters.get(key)
+    if getter is None:
+        getter = _getters[key] = _build_getter(obj, fields)
     try:
-        fx_sig = czsc_signals.cxt_fxs_fx_is_inside_b1(
-            k1=f"{freq}", k2="fx", k3="inside", di=1, m=3,
-        )
-        signals.append({"name": "cxt_fxs_fx_is_inside_b1", "value": fx_sig})
-    except Exception:
-        pass
+        return getter(obj)
+    except AttributeError:
+        # Only for types whose instances differ in layout (e.g. namespaces).
+        return _build_getter(obj, fields)(obj)
+
+
+def _as_float(v: Any) -> Any:
     try:
-        power_sig = czsc_signals.bar_zdt_power_V230313(
-            k1=f"{freq}", k2="bar", k3="zdt_power", di=1, th=0.8,
-        )
-        signals.append({"name": "bar_zdt_power_V230313", "value": power_sig})
+        return float(v)
     except Exception:
-        pass
+        return v
+
+
+def serialize_dts(seq: Sequence[Any]) -> List[Any]:
+    # Convert all datetimes in one numpy call; other values pass through.
+    out = list(seq)
+    idx = [i for i, v in enumerate(out) if isinstance(v, (datetime, pd.Timestamp))]
+    if idx:
+        arr = np.array([out[i] for i in idx], dtype="datetime64[us]")
+        for i, iso in zip(idx, np.datetime_as_string(arr, unit="s").tolist()):
+            out[i] = iso
+    return out
+
+
+def _serialize_dt_slots(slots: List[Tuple[Dict[str, Any], str]]) -> None:
+    # Each slot is a (dict, key) whose value still holds a raw datetime.
+    for (d, k), iso in zip(slots, serialize_dts([d[k] for d, k in slots])):
+        d[k] = iso
+
+
+# Signal functions from czsc 0.9.69 that take the analyzer positionally and
+# return an OrderedDict of {signal key: value}.
+_BASIC_SIGNALS = ("bar_zdt_V230331", "cxt_fx_power_V221107")
+
+
+def _df_to_bars(df: pd.DataFrame) -> Bars:
+    df = df.assign(dt=pd.to_datetime(df["dt"], format="ISO8601", cache=True))
+    df = df.sort_values("dt", ignore_index=True)
+    columns = {c: df[c].tolist() for c in ("dt", "open", "high", "low", "close", "vol", "amount") if c in df}
+    symbol = str(df["code"].iat[0]) if "code" in df and len(df) else ""
+    return {"symbol": symbol, "columns": columns}
+
+
+def chan_basic_signals(bars_or_df: Union[Bars, pd.DataFrame], freq: str) -> List[Dict[str, Any]]:
+    if czsc_signals is None or CZSC is None:
+        raise RuntimeError("czsc is not installed; see requirements.txt")
+    bars = _df_to_bars(bars_or_df) if isinstance(bars_or_df, pd.DataFrame) else bars_or_df
+    # Build the analyzer once and evaluate every signal against it.
+    analyzer = CZSC(bars_to_rawbar_objs(bars, freq))
+
+    signals: List[Dict[str, Any]] = []
+    for name in _BASIC_SIGNALS:
+        try:
+            value = getattr(czsc_signals, name)(analyzer, di=1)
+            signals.append({"name": name, "value": dict(value)})
+        except Exception:
+            pass
     return signals
 
 
-def analyze_structure(bars: List[Dict[str, Any]], level: str) -> Dict[str, Any]:
+def analyze_structure(bars: Bars, level: str, freq: str) -> Dict[str, Any]:
     if CZSC is None or RawBar is None:
         raise RuntimeError("czsc.analyze 未可用，请确认已安装 czsc >= 0.9.x")
-    rawbars = bars_to_rawbar_objs(bars)
+    rawbars = bars_to_rawbar_objs(bars, freq)
     analyzer = CZSC(rawbars)
 
     result_items: List[Dict[str, Any]] = []
     beichi: Optional[Dict[str, Any]] = None
+    dt_slots: List[Tuple[Dict[str, Any], str]] = []
 
     if level == "bi":
         bi_list = getattr(analyzer, "bi_list", []) or []
-        for bi in bi_list:
+        bi_values = [_get_attrs(bi, _BI_FIELDS) for bi in bi_list]
+        for bi, (direction, high, low, power, length, start_dt, end_dt, fx_a, fx_b) in zip(bi_list, bi_values):
             item: Dict[str, Any] = {}
-            for attr in [
-                "direction", "high", "low", "power", "length", "start_dt", "end_dt", "fx_a", "fx_b",
-            ]:
-                v = getattr(bi, attr, None)
+            for attr, v in (("direction", direction), ("high", high), ("low", low), ("power", power), ("length", length)):
+                if v is not None:
+                    item[attr] = _as_float(v)
+            for attr, v in (("start_dt", start_dt), ("end_dt", end_dt)):
+                if v is not None:
+                    item[attr] = v
+                    dt_slots.append((item, attr))
+            for attr, v in (("fx_a", fx_a), ("fx_b", fx_b)):
                 if v is None:
                     continue
-                if attr in {"start_dt", "end_dt"}:
-                    item[attr] = serialize_dt(v)
-                elif attr in {"fx_a", "fx_b"}:
-                    try:
-                        item[attr] = {
-                            "dt": serialize_dt(getattr(v, "dt", None)),
-                            "price": float(getattr(v, "price", float("nan"))),
-                            "fx": getattr(v, "fx", None),
-                        }
-                    except Exception:
-                        item[attr] = str(v)
-                else:
-                    try:
-                        item[attr] = float(v)
-                    except Exception:
-                        item[attr] = v
+                try:
+                    fx_dt, fx_price, fx_mark = _get_attrs(v, _FX_FIELDS)
+                    item[attr] = {
+                        "dt": fx_dt,
+                        "price": float("nan") if fx_price is None else float(fx_price),
+                        "fx": fx_mark,
+                    }
+                    dt_slots.append((item[attr], "dt"))
+                except Exception:
+                    item[attr] = str(v)
             if not item:
                 item["text"] = str(bi)
             result_items.append(item)
 
-        same_dir = [b for b in bi_list if getattr(b, "direction", None) in {"up", "down", "向上", "向下"}]
-        last = None
-        prev = None
-        for b in reversed(same_dir):
-            if last is None:
-                last = b
-            elif prev is None and getattr(b, "direction", None) == getattr(last, "direction", None):
-                prev = b
-                break
-        if last is not None and prev is not None:
-            try:
-                last_len = abs(float(getattr(last, "high", 0)) - float(getattr(last, "low", 0)))
-                prev_len = abs(float(getattr(prev, "high", 0)) - float(getattr(prev, "low", 0)))
-                direction = getattr(last, "direction", None)
-                bearish = direction in {"up", "向上"} and float(getattr(last, "high", 0)) <= float(getattr(prev, "high", 0)) and last_len < prev_len
-                bullish = direction in {"down", "向下"} and float(getattr(last, "low", 0)) >= float(getattr(prev, "low", 0)) and last_len < prev_len
-                if bearish or bullish:
-                    beichi = {
-                        "type": "bearish" if bearish else "bullish",
-                        "last_start": serialize_dt(getattr(last, "start_dt", None)),
-                        "last_end": serialize_dt(getattr(last, "end_dt", None)),
-                        "prev_start": serialize_dt(getattr(prev, "start_dt", None)),
-                        "prev_end": serialize_dt(getattr(prev, "end_dt", None)),
-                    }
-            except Exception:
-                beichi = None
+        try:
+            n = len(bi_list)
+            # czsc's Direction is a plain Enum (Up = "向上"), so look up its value.
+            dirs = np.fromiter(
+                (_DIRECTION_CODES.get(getattr(v[0], "value", v[0]), -1) for v in bi_values), dtype=np.int8, count=n,
+            )
+            highs = np.fromiter(
+                (float(v[1] or 0) if d >= 0 else np.nan for v, d in zip(bi_values, dirs)), dtype=np.float64, count=n,
+            )
+            lows = np.fromiter(
+                (float(v[2] or 0) if d >= 0 else np.nan for v, d in zip(bi_values, dirs)), dtype=np.float64, count=n,
+            )
+            last_i, prev_i, kind = _find_divergence(dirs, highs, lows)
+            if kind != _NO_BEICHI:
+                last_start, last_end, prev_start, prev_end = serialize_dts([
+                    *bi_values[last_i][5:7], *bi_values[prev_i][5:7],
+                ])
+                beichi = {
+                    "type": "bearish" if kind == _BEARISH else "bullish",
+                    "last_start": last_start,
+                    "last_end": last_end,
+                    "prev_start": prev_start,
+                    "prev_end": prev_end,
+                }
+        except Exception:
+            beichi = None
 
     else:
         zs_list = getattr(analyzer, "zs_list", []) or []
         for zs in zs_list:
             item = {}
-            for attr in ["zd", "zg", "gg", "dd", "start_dt", "end_dt", "level", "direction"]:
-                v = getattr(zs, attr, None)
+            for attr, v in zip(_ZS_FIELD_NAMES, _get_attrs(zs, _ZS_FIELDS)):
                 if v is None:
                     continue
                 if attr in {"start_dt", "end_dt"}:
-                    item[attr] = serialize_dt(v)
+                    item[attr] = v
+                    dt_slots.append((item, attr))
                 else:
-                    try:
-                        item[attr] = float(v)
-                    except Exception:
-                        item[attr] = v
+                    item[attr] = _as_float(v)
             if not item:
                 item["text"] = str(zs)
             result_items.append(item)
 
+    _serialize_dt_slots(dt_slots)
     return {"items": result_items, "beichi": beichi}
 
 
@@ -1,31 +1,88 @@
 from __future__ import annotations
 
+import atexit
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+from functools import lru_cache
+from pathlib import Path
 from typing import List, Optional, Dict, Any
 
+import numpy as np
 import pandas as pd
 import baostock as bs
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:  # pragma: no cover
+    pa = None
+    pq = None
 
+__all__ = [
+    "normalize_symbol",
+    "map_freq_to_baostock",
+    "ensure_dates",
+    "baostock_login",
+    "baostock_logout",
+    "fetch_bars_df",
+    "fetch_bars_batch",
+    "to_bar_columns",
+    "to_rawbars",
+    "to_arrow_ipc",
+]
+
+
+# Parquet cache of fetched bars, one file per (symbol, freq, adjustflag).
+# Set CHAN_MCP_CACHE_DIR to an empty string to disable it.
+CACHE_DIR = os.environ.get("CHAN_MCP_CACHE_DIR", os.path.join("~", ".cache", "chan-mcp"))
+BAOSTOCK_START_DATE = date(2015, 1, 1)
+_COVERAGE_KEY = b"chan_mcp_coverage"
+# Only well-formed A-share codes name cache files, so user input can never
+# steer a path outside CACHE_DIR.
+_CACHEABLE_SYMBOL = re.compile(r"^(sh|sz|bj)\.\d{6}$")
+# Bound the in-process memo by total rows rather than entries: one symbol's
+# 5m history since 2015 is ~130k rows.
+_CACHE_MEMO_MAX_ROWS = 200_000
+_cache_memo: Dict[str, tuple[int, tuple[pd.DataFrame, date, date]]] = {}
+
+# Parallel BaoStock sessions used by fetch_bars_batch.
+BATCH_MAX_WORKERS = 8
+
+# Fields coerced to numbers after a query, and the subset narrowed to
+# float32 for the Arrow transport.
+_NUMERIC_FIELDS = ("open", "high", "low", "close", "volume", "amount", "preclose", "turn", "pctChg", "tradestatus", "isST")
+_FLOAT32_FIELDS = ("open", "high", "low", "close", "preclose", "amount", "turn", "pctChg")
+
+
+_FREQ_MAP = {
+    "5m": "5",
+    "15m": "15",
+    "30m": "30",
+    "60m": "60",
+    "d": "d",
+    "w": "w",
+    "m": "m",
+    "day": "d",
+    "daily": "d",
+}
+
+
+@lru_cache(maxsize=4096)
 def normalize_symbol(symbol: str) -> str:
     s = symbol.strip().lower().replace("_", ".").replace("-", ".")
     return s
 
 
+@lru_cache(maxsize=32)
 def map_freq_to_baostock(freq: str) -> str:
     f = str(freq).lower()
-    mapping = {
-        "5m": "5",
-        "15m": "15",
-        "30m": "30",
-        "60m": "60",
-        "d": "d",
-        "w": "w",
-        "m": "m",
-        "day": "d",
-        "daily": "d",
-    }
-    if f in mapping:
-        return mapping[f]
+    if f in _FREQ_MAP:
+        return _FREQ_MAP[f]
     if f.endswith("m") and f[:-1].isdigit() and f in {"5m", "15m", "30m", "60m"}:
         return f[:-1]
     if f in {"5", "15", "30", "60", "d", "w", "m"}:
@@ -38,20 +95,55 @@ def ensure_dates(start_date: Optional[str], end_date: Optional[str]) -> tuple[st
     return start_date or "", end_date or ""
 
 
-def baostock_login() -> None:
-    lg = bs.login()
-    if lg.error_code != "0":
-        raise RuntimeError(f"baostock login failed: {lg.error_msg}")
+_login_lock = threading.Lock()
+_logged_in = False
+_logout_registered = False
 
 
-def baostock_logout() -> None:
+def _logout_at_exit() -> None:
     try:
         bs.logout()
     except Exception:
         pass
 
 
-def fetch_bars_df(symbol: str, start_date: str, end_date: str, freq: str, adjustflag: str) -> pd.DataFrame:
+def _login_locked() -> None:
+    global _logged_in, _logout_registered
+    lg = bs.login()
+    if lg.error_code != "0":
+        raise RuntimeError(f"baostock login failed: {lg.error_msg}")
+    _logged_in = True
+    if not _logout_registered:
+        atexit.register(_logout_at_exit)
+        _logout_registered = True
+
+
+def baostock_login() -> None:
+    # Log in once per process; later tool calls reuse the session.
+    with _login_lock:
+        if not _logged_in:
+            _login_locked()
+
+
+def _baostock_relogin() -> None:
+    # The shared session was dropped (idle timeout, socket reset, ...).
+    global _logged_in
+    with _login_lock:
+        _logged_in = False
+        _login_locked()
+
+
+def _is_session_error(error_code: str) -> bool:
+    # 10001001: not logged in; 10002xxx: socket/network failures.
+    return error_code == "10001001" or error_code.startswith("10002")
+
+
+def baostock_logout() -> None:
+    # The session is shared across tool calls and closed at interpreter exit.
+    pass
+
+
+def _query_bars_df(symbol: str, start_date: str, end_date: str, freq: str, adjustflag: str) -> pd.DataFrame:
     if freq in {"5", "15", "30", "60"}:
         fields = [
             "date", "time", "code", "open", "high", "low", "close", "volume", "amount", "adjustflag",
@@ -65,79 +157,305 @@ def fetch_bars_df(symbol: str, start_date: str, end_date: str, freq: str, adjust
             "date", "code", "open", "high", "low", "close", "preclose", "volume", "amount", "adjustflag", "turn", "tradestatus", "pctChg", "isST",
         ]
 
-    rs = bs.query_history_k_data_plus(
-        code=symbol,
-        fields=",".join(fields),
-        start_date=start_date,
-        end_date=end_date,
-        frequency= freq,
-        adjustflag=adjustflag,
-    )
-    if rs.error_code != "0":
+    # A dropped session surfaces as a session/network error code; log in
+    # again and retry once before giving up.
+    for attempt in range(2):
+        rs = bs.query_history_k_data_plus(
+            code=symbol,
+            fields=",".join(fields),
+            start_date=start_date,
+            end_date=end_date,
+            frequency= freq,
+            adjustflag=adjustflag,
+        )
+        # Collect column-wise so the frame is built from per-field lists
+        # without an intermediate row-major list-of-lists transpose.
+        cols: tuple[List[str], ...] = tuple([] for _ in fields)
+        appends = [c.append for c in cols]
+        while rs.error_code == "0" and rs.next():
+            for append, value in zip(appends, rs.get_row_data()):
+                append(value)
+        if rs.error_code == "0":
+            break
+        if attempt == 0 and _is_session_error(rs.error_code):
+            _baostock_relogin()
+            continue
         raise RuntimeError(f"baostock query failed: {rs.error_msg}")
 
-    data_list: List[List[str]] = []
-    while rs.error_code == "0" and rs.next():
-        data_list.append(rs.get_row_data())
-
-    df = pd.DataFrame(data_list, columns=fields)
+    df = pd.DataFrame(dict(zip(fields, cols)), columns=fields)
     if df.empty:
         return df
 
-    df["open"] = pd.to_numeric(df["open"], errors="coerce")
-    df["high"] = pd.to_numeric(df["high"], errors="coerce")
-    df["low"] = pd.to_numeric(df["low"], errors="coerce")
-    df["close"] = pd.to_numeric(df["close"], errors="coerce")
-    df["volume"] = pd.to_numeric(df["volume"], errors="coerce")
-    if "amount" in df.columns:
-        df["amount"] = pd.to_numeric(df["amount"], errors="coerce")
-    if "preclose" in df.columns:
-        df["preclose"] = pd.to_numeric(df.get("preclose"), errors="coerce")
     if "turn" in df.columns:
-        df["turn"] = pd.to_numeric(df["turn"].replace({"": "0"}), errors="coerce")
-    if "pctChg" in df.columns:
-        df["pctChg"] = pd.to_numeric(df["pctChg"], errors="coerce")
-    if "tradestatus" in df.columns:
-        df["tradestatus"] = pd.to_numeric(df["tradestatus"], errors="coerce")
-    if "isST" in df.columns:
-        df["isST"] = pd.to_numeric(df["isST"], errors="coerce")
+        df["turn"] = df["turn"].replace({"": "0"})
+    num_cols = [c for c in _NUMERIC_FIELDS if c in df.columns]
+    df[num_cols] = df[num_cols].apply(pd.to_numeric, errors="coerce")
+    for c in ("tradestatus", "isST"):
+        if c in df.columns:
+            # Stays float64 when the column has gaps.
+            df[c] = pd.to_numeric(df[c], downcast="integer")
 
+    # BaoStock uses fixed layouts: date is YYYY-MM-DD and the minute-bar time
+    # is YYYYMMDDHHMMSSsss (it already carries the date).
     if "time" in df.columns and df["time"].notna().any():
-        dt = df["date"].astype(str) + " " + df["time"].astype(str)
-        df["datetime"] = pd.to_datetime(dt, errors="coerce")
+        df["datetime"] = pd.to_datetime(df["time"].str[:14], format="%Y%m%d%H%M%S", errors="coerce", cache=True)
     else:
-        df["datetime"] = pd.to_datetime(df["date"], errors="coerce")
+        df["datetime"] = pd.to_datetime(df["date"], format="%Y-%m-%d", errors="coerce", cache=True)
 
     return df.dropna(subset=["datetime"]).sort_values("datetime").reset_index(drop=True)
 
 
+def _cache_path(symbol: str, freq: str, adjustflag: str) -> Path:
+    return Path(CACHE_DIR).expanduser() / f"{symbol}_{freq}_{adjustflag}.parquet"
+
+
+def _load_cache(path: Path) -> Optional[tuple[pd.DataFrame, date, date]]:
+    # In-process memo keyed by path; the stored mtime guards against serving
+    # a file that another process has rewritten since.
+    key = str(path)
+    try:
+        mtime_ns = path.stat().st_mtime_ns
+        hit = _cache_memo.pop(key, None)
+        if hit is None or hit[0] != mtime_ns:
+            table = pq.read_table(key)
+            start, end = table.schema.metadata[_COVERAGE_KEY].decode().split(",")
+            hit = (mtime_ns, (table.to_pandas(), date.fromisoformat(start), date.fromisoformat(end)))
+    except Exception:
+        return None
+    _remember_cache(key, hit)
+    return hit[1]
+
+
+def _remember_cache(key: str, entry: tuple[int, tuple[pd.DataFrame, date, date]]) -> None:
+    _cache_memo.pop(key, None)
+    if len(entry[1][0]) > _CACHE_MEMO_MAX_ROWS:
+        return
+    _cache_memo[key] = entry
+    rows = sum(len(e[1][0]) for e in _cache_memo.values())
+    while rows > _CACHE_MEMO_MAX_ROWS:
+        rows -= len(_cache_memo.pop(next(iter(_cache_memo)))[1][0])
+
+
+def _write_cache(path: Path, df: pd.DataFrame, start: date, end: date) -> None:
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[_COVERAGE_KEY] = f"{start.isoformat()},{end.isoformat()}".encode()
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pq.write_table(table.replace_schema_metadata(metadata), tmp)
+        os.replace(tmp, path)
+        _remember_cache(str(path), (path.stat().st_mtime_ns, (df, start, end)))
+    except OSError:
+        _cache_memo.pop(str(path), None)
+
+
+def fetch_bars_df(symbol: str, start_date: str, end_date: str, freq: str, adjustflag: str) -> pd.DataFrame:
+    # Forward-adjusted prices ("2") are rewritten on every ex-dividend date, so
+    # only unadjusted and back-adjusted history is safe to keep on disk.
+    if pq is None or not CACHE_DIR or adjustflag == "2" or not _CACHEABLE_SYMBOL.match(symbol):
+        return _query_bars_df(symbol, start_date, end_date, freq, adjustflag)
+    today = date.today()
+    try:
+        start = date.fromisoformat(start_date) if start_date else BAOSTOCK_START_DATE
+        end = min(date.fromisoformat(end_date), today) if end_date else today
+    except ValueError:
+        return _query_bars_df(symbol, start_date, end_date, freq, adjustflag)
+    if start > end:
+        return _query_bars_df(symbol, start_date, end_date, freq, adjustflag)
+
+    path = _cache_path(symbol, freq, adjustflag)
+    cached = _load_cache(path)
+    if cached is None:
+        cached = (pd.DataFrame(), start, start - timedelta(days=1))
+    cached_df, cov_start, cov_end = cached
+    stored_end = cov_end
+
+    frames = [cached_df]
+    fetched_head = start < cov_start
+    if fetched_head:
+        head_end = cov_start - timedelta(days=1)
+        frames.insert(0, _query_bars_df(symbol, start.isoformat(), head_end.isoformat(), freq, adjustflag))
+        cov_start = start
+    if end > cov_end:
+        tail_start = cov_end + timedelta(days=1)
+        frames.append(_query_bars_df(symbol, tail_start.isoformat(), end.isoformat(), freq, adjustflag))
+        cov_end = end
+
+    if len(frames) == 1:
+        df = cached_df
+    else:
+        frames = [f for f in frames if not f.empty]
+        df = pd.DataFrame()
+        if frames:
+            df = pd.concat(frames, ignore_index=True)
+            df = df.drop_duplicates("datetime", keep="last").sort_values("datetime", ignore_index=True)
+
+    # Today's bar may still be forming; keep it out of the cache so the next
+    # call refetches it. Only rewrite the file when the stored coverage grows,
+    # not for every refetch of today's tail.
+    yesterday = today - timedelta(days=1)
+    if fetched_head or min(cov_end, yesterday) > stored_end:
+        stored = df[df["date"] <= yesterday.isoformat()] if not df.empty else df
+        _write_cache(path, stored, cov_start, min(cov_end, yesterday))
+
+    if df.empty:
+        return df
+    mask = (df["date"] >= start.isoformat()) & (df["date"] <= end.isoformat())
+    return df[mask].reset_index(drop=True)
+
+
+_batch_pool: Optional[ProcessPoolExecutor] = None
+_batch_pool_lock = threading.Lock()
+
+
+def _get_batch_pool() -> ProcessPoolExecutor:
+    # BaoStock talks over one module-global socket, so concurrent queries from
+    # threads would interleave on the wire. Fan out over spawned processes
+    # instead, each logging in once; the pool is created on first use and
+    # reused so later batches skip worker start-up and login.
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None:
+            ctx = multiprocessing.get_context("spawn")
+            _batch_pool = ProcessPoolExecutor(max_workers=BATCH_MAX_WORKERS, mp_context=ctx, initializer=baostock_login)
+            atexit.register(_batch_pool.shutdown, wait=False, cancel_futures=True)
+        return _batch_pool
+
+
+def _discard_batch_pool(pool: ProcessPoolExecutor) -> None:
+    # A broken pool (e.g. a worker failed to log in) is replaced on next use.
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is pool:
+            _batch_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def fetch_bars_batch(
+    symbols: List[str],
+    start_date: str,
+    end_date: str,
+    freq: str,
+    adjustflag: str,
+) -> tuple[Dict[str, pd.DataFrame], Dict[str, str]]:
+    # Returns (frames, errors), both keyed by symbol; login failures are
+    # reported per symbol like query failures.
+    frames: Dict[str, pd.DataFrame] = {}
+    errors: Dict[str, str] = {}
+    if len(symbols) <= 1:
+        try:
+            baostock_login()
+        except Exception as e:
+            return frames, {s: str(e) for s in symbols}
+        for s in symbols:
+            try:
+                frames[s] = fetch_bars_df(s, start_date, end_date, freq, adjustflag)
+            except Exception as e:
+                errors[s] = str(e)
+        return frames, errors
+
+    pool = _get_batch_pool()
+    try:
+        futures = {pool.submit(fetch_bars_df, s, start_date, end_date, freq, adjustflag): s for s in symbols}
+    except BrokenProcessPool as e:
+        _discard_batch_pool(pool)
+        return frames, {s: str(e) for s in symbols}
+    broken = False
+    for fut in as_completed(futures):
+        s = futures[fut]
+        try:
+            frames[s] = fut.result()
+        except BrokenProcessPool as e:
+            broken = True
+            errors[s] = str(e)
+        except Exception as e:
+            errors[s] = str(e)
+    if broken:
+        _discard_batch_pool(pool)
+    return frames, errors
+
+
+_BAR_COLUMNS = ("code", "dt", "open", "close", "high", "low", "vol", "amount")
+_EXTRA_COLUMNS = ("preclose", "turn", "pctChg", "tradestatus", "isST")
+_INT_EXTRA_COLUMNS = {"tradestatus", "isST"}
+
+
+def to_bar_columns(df: pd.DataFrame, symbol: str) -> Dict[str, List[Any]]:
+    # Column-oriented (SoA) view of the bars: one list per field, keys stored once.
+    if df.empty:
+        return {c: [] for c in _BAR_COLUMNS}
+    n = len(df)
+    columns: Dict[str, List[Any]] = {
+        "code": df["code"].astype(str).tolist() if "code" in df.columns else [symbol] * n,
+        "dt": np.datetime_as_string(df["datetime"].to_numpy(dtype="datetime64[s]"), unit="s").tolist(),
+        "open": df["open"].to_numpy(dtype=np.float64).tolist(),
+        "close": df["close"].to_numpy(dtype=np.float64).tolist(),
+        "high": df["high"].to_numpy(dtype=np.float64).tolist(),
+        "low": df["low"].to_numpy(dtype=np.float64).tolist(),
+        "vol": df["volume"].to_numpy(dtype=np.float64).tolist(),
+        "amount": df["amount"].to_numpy(dtype=np.float64).tolist() if "amount" in df.columns else [0.0] * n,
+    }
+
+    # Sanitize the sidecar columns as one 2-D block: NaN -> None, flags -> int.
+    extra_cols = [c for c in _EXTRA_COLUMNS if c in df.columns]
+    if extra_cols:
+        block = df[extra_cols].to_numpy(dtype=np.float64)
+        missing = np.isnan(block)
+        for j, c in enumerate(extra_cols):
+            if c in _INT_EXTRA_COLUMNS:
+                vals = np.nan_to_num(block[:, j]).astype(np.int64).astype(object)
+            else:
+                vals = block[:, j].astype(object)
+            vals[missing[:, j]] = None
+            columns[c] = vals.tolist()
+    return columns
+
+
 def to_rawbars(df: pd.DataFrame, symbol: str) -> List[Dict[str, Any]]:
-    rows: List[Dict[str, Any]] = []
-    for _, r in df.iterrows():
-        rows.append(
-            {
-                "symbol": symbol,
-                "code": str(r.get("code", symbol)),
-                "dt": r["datetime"].to_pydatetime().isoformat(),
-                "open": float(r["open"]),
-                "close": float(r["close"]),
-                "high": float(r["high"]),
-                "low": float(r["low"]),
-                "vol": float(r["volume"]),
-                "amount": float(r.get("amount", 0.0)),
-                "extra": {
-                    k: (None if pd.isna(v) else float(v) if k in {"preclose", "turn", "pctChg"} else int(v) if k in {"tradestatus", "isST"} else v)
-                    for k, v in {
-                        "preclose": r.get("preclose"),
-                        "turn": r.get("turn"),
-                        "pctChg": r.get("pctChg"),
-                        "tradestatus": r.get("tradestatus"),
-                        "isST": r.get("isST"),
-                    }.items()
-                    if k in df.columns
-                },
-            }
-        )
-    return rows
+    columns = to_bar_columns(df, symbol)
+    extra_cols = [c for c in _EXTRA_COLUMNS if c in columns]
+    if extra_cols:
+        extras = [dict(zip(extra_cols, vs)) for vs in zip(*(columns[c] for c in extra_cols))]
+    else:
+        extras = [{} for _ in columns["dt"]]
+
+    return [
+        {
+            "symbol": symbol,
+            "code": c,
+            "dt": d,
+            "open": o,
+            "close": cl,
+            "high": h,
+            "low": lo,
+            "vol": v,
+            "amount": a,
+            "extra": e,
+        }
+        for c, d, o, cl, h, lo, v, a, e in zip(*(columns[k] for k in _BAR_COLUMNS), extras)
+    ]
+
+
+def _downcast_for_transport(df: pd.DataFrame) -> pd.DataFrame:
+    # A-share prices and ratios fit float32 comfortably; volume is a share
+    # count. Only the binary transport is narrowed: float32 values would print
+    # with spurious digits in JSON, and czsc keeps working on float64.
+    df = df.astype({c: np.float32 for c in _FLOAT32_FIELDS if c in df.columns})
+    if "volume" in df.columns and df["volume"].notna().all():
+        df["volume"] = df["volume"].astype(np.int64)
+    return df
 
 
+def to_arrow_ipc(df: pd.DataFrame) -> bytes:
+    # Arrow IPC stream of the bars frame; the date/time strings and the
+    # constant adjustflag column are redundant next to datetime and dropped.
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed; see requirements.txt")
+    df = df.drop(columns=[c for c in ("date", "time", "adjustflag") if c in df.columns])
+    df = _downcast_for_transport(df)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
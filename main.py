@@ -1,7 +1,7 @@
 from server import mcp  # single FastMCP instance
 
 # Import tools to register them via decorators
-from tools.market_tools import get_bars, chan_signals, chan_structure  # noqa: F401
+from tools.market_tools import get_bars, get_bars_batch, get_bars_arrow, chan_signals, chan_structure  # noqa: F401
 
 
 if __name__ == "__main__":
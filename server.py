@@ -1,6 +1,18 @@
+from typing import Any
+
 from fastmcp import FastMCP
 
-# Single FastMCP instance for decorators across modules
-mcp = FastMCP("chan-mcp")
+try:
+    import orjson
+except Exception:  # pragma: no cover
+    orjson = None
+
 
+def orjson_serializer(data: Any) -> str:
+    # orjson encodes dicts/lists/floats and numpy values in C; anything it
+    # cannot encode falls back to str(), like FastMCP's default serializer.
+    return orjson.dumps(data, default=str, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
 
+
+# Single FastMCP instance for decorators across modules
+mcp = FastMCP("chan-mcp", tool_serializer=orjson_serializer if orjson is not None else None)
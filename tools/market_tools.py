@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from typing import Literal, Optional
+import base64
+from typing import List, Literal, Optional
 
 import pandas as pd
 
@@ -10,12 +11,27 @@ from datasource.baostock_client import (
     ensure_dates,
     map_freq_to_baostock,
     baostock_login,
-    baostock_logout,
     fetch_bars_df,
+    fetch_bars_batch,
+    to_bar_columns,
     to_rawbars,
+    to_arrow_ipc,
 )
 from analysis.czsc_analysis import chan_basic_signals, analyze_structure
 
+__all__ = [
+    "get_bars_local",
+    "get_bars_batch_local",
+    "get_bars_arrow_local",
+    "chan_signals_local",
+    "chan_structure_local",
+    "get_bars",
+    "get_bars_batch",
+    "get_bars_arrow",
+    "chan_signals",
+    "chan_structure",
+]
+
 
 # -------------
 # Direct-call API (non-decorated)
@@ -26,25 +42,81 @@ def get_bars_local(
     end_date: Optional[str] = None,
     freq: Literal["5m", "15m", "30m", "60m", "d", "w", "m"] = "d",
     adjustflag: Literal["1", "2", "3"] = "3",
+    format: Literal["aos", "soa"] = "soa",
 ) -> dict:
     s = normalize_symbol(symbol)
     sd, ed = ensure_dates(start_date, end_date)
     bo_freq = map_freq_to_baostock(freq)
 
     baostock_login()
-    try:
-        df = fetch_bars_df(s, sd, ed, bo_freq, adjustflag)
-    finally:
-        baostock_logout()
+    df = fetch_bars_df(s, sd, ed, bo_freq, adjustflag)
+    return _bars_payload(df, s, freq, sd, ed, format)
+
+
+def _bars_payload(df: pd.DataFrame, symbol: str, freq: str, sd: str, ed: str, format: str) -> dict:
+    payload = {
+        "symbol": symbol,
+        "freq": freq,
+        "start_date": sd,
+        "end_date": ed,
+        "count": len(df),
+        "format": format,
+    }
+    if format == "aos":
+        payload["bars"] = to_rawbars(df, symbol)
+    else:
+        payload["columns"] = to_bar_columns(df, symbol)
+    return payload
+
+
+def get_bars_batch_local(
+    symbols: List[str],
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    freq: Literal["5m", "15m", "30m", "60m", "d", "w", "m"] = "d",
+    adjustflag: Literal["1", "2", "3"] = "3",
+    format: Literal["aos", "soa"] = "soa",
+) -> dict:
+    syms = list(dict.fromkeys(normalize_symbol(s) for s in symbols))
+    sd, ed = ensure_dates(start_date, end_date)
+    bo_freq = map_freq_to_baostock(freq)
+
+    frames, errors = fetch_bars_batch(syms, sd, ed, bo_freq, adjustflag)
+    items = []
+    for s in syms:
+        if s in errors:
+            items.append({"symbol": s, "error": errors[s]})
+        else:
+            items.append(_bars_payload(frames[s], s, freq, sd, ed, format))
+    return {
+        "freq": freq,
+        "start_date": sd,
+        "end_date": ed,
+        "count": len(items),
+        "items": items,
+    }
+
+
+def get_bars_arrow_local(
+    symbol: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    freq: Literal["5m", "15m", "30m", "60m", "d", "w", "m"] = "d",
+    adjustflag: Literal["1", "2", "3"] = "3",
+) -> dict:
+    s = normalize_symbol(symbol)
+    sd, ed = ensure_dates(start_date, end_date)
+    bo_freq = map_freq_to_baostock(freq)
 
-    bars = to_rawbars(df, s)
+    baostock_login()
+    df = fetch_bars_df(s, sd, ed, bo_freq, adjustflag)
     return {
         "symbol": s,
         "freq": freq,
         "start_date": sd,
         "end_date": ed,
-        "count": len(bars),
-        "bars": bars,
+        "count": len(df),
+        "arrow_ipc_b64": base64.b64encode(to_arrow_ipc(df)).decode("ascii"),
     }
 
 
@@ -56,16 +128,13 @@ def chan_signals_local(
     adjustflag: Literal["1", "2", "3"] = "3",
 ) -> dict:
     payload = get_bars_local(symbol, start_date, end_date, freq, adjustflag)
-    bars = payload["bars"]
-    if not bars:
+    if not payload["count"]:
         return {"symbol": symbol, "freq": freq, "signals": [], "count": 0}
-    import pandas as pd  # local to avoid import cycles
-    df = pd.DataFrame(bars).sort_values("dt").reset_index(drop=True)
-    signals = chan_basic_signals(df[["dt", "open", "high", "low", "close"]], freq)
+    signals = chan_basic_signals(payload, freq)
     return {
         "symbol": payload["symbol"],
         "freq": freq,
-        "count": len(df),
+        "count": payload["count"],
         "signals": signals,
     }
 
@@ -79,15 +148,14 @@ def chan_structure_local(
     level: Literal["bi", "zs"] = "bi",
 ) -> dict:
     payload = get_bars_local(symbol, start_date, end_date, freq, adjustflag)
-    bars = payload["bars"]
-    if not bars:
+    if not payload["count"]:
         return {"symbol": symbol, "freq": freq, "level": level, "items": [], "beichi": None}
-    struct = analyze_structure(bars, level)
+    struct = analyze_structure(payload, level, freq)
     return {
         "symbol": payload["symbol"],
         "freq": freq,
         "level": level,
-        "count": len(bars),
+        "count": payload["count"],
         **struct,
     }
 
@@ -99,8 +167,32 @@ def get_bars(
     end_date: Optional[str] = None,
     freq: Literal["5m", "15m", "30m", "60m", "d", "w", "m"] = "d",
     adjustflag: Literal["1", "2", "3"] = "3",
+    format: Literal["aos", "soa"] = "soa",
+) -> dict:
+    return get_bars_local(symbol, start_date, end_date, freq, adjustflag, format)
+
+
+@mcp.tool()
+def get_bars_batch(
+    symbols: List[str],
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    freq: Literal["5m", "15m", "30m", "60m", "d", "w", "m"] = "d",
+    adjustflag: Literal["1", "2", "3"] = "3",
+    format: Literal["aos", "soa"] = "soa",
+) -> dict:
+    return get_bars_batch_local(symbols, start_date, end_date, freq, adjustflag, format)
+
+
+@mcp.tool()
+def get_bars_arrow(
+    symbol: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    freq: Literal["5m", "15m", "30m", "60m", "d", "w", "m"] = "d",
+    adjustflag: Literal["1", "2", "3"] = "3",
 ) -> dict:
-    return get_bars_local(symbol, start_date, end_date, freq, adjustflag)
+    return get_bars_arrow_local(symbol, start_date, end_date, freq, adjustflag)
 
 
 @mcp.tool()